@@ -1,14 +1,25 @@
 import argparse
 import csv
+import hashlib
 import json
 import os
 import re
+import socket
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # 有裝就用（快很多），沒裝退回標準 json
+except ImportError:
+    orjson = None
 
 
 MOPS_BASE = "https://mops.twse.com.tw/mops/api"
@@ -17,6 +28,54 @@ DETAIL_API = f"{MOPS_BASE}/t05st02_detail"
 
 TAIPEI_TZ = ZoneInfo("Asia/Taipei")
 
+# 只給 MOPS 用的 header（Telegram / LINE 不帶這些）
+MOPS_HEADERS = {
+    "Accept": "*/*",
+    "Origin": "https://mops.twse.com.tw",
+    "Referer": "https://mops.twse.com.tw/mops/web/t05st02",
+    "User-Agent": "Mozilla/5.0 (GitHubActions; +https://github.com)",
+}
+
+# detail 同時最多幾個請求（同一個 host，別打太兇）
+DETAIL_WORKERS = 8
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    # TCP_NODELAY：小的 JSON POST 不要被 Nagle 卡住（urllib3 預設已開，這裡明確帶上）
+    # SO_KEEPALIVE：池內閒置連線不會被中間設備默默斷掉
+    SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def build_session() -> requests.Session:
+    # 共用一個 Session：list / detail / 通知都走同一個連線池，省掉每次 TCP+TLS 握手
+    session = requests.Session()
+    # 一般 https（Telegram / LINE）：只重用連線，不重送 POST（避免重複通知）
+    session.mount("https://", KeepAliveAdapter(pool_connections=4, pool_maxsize=16))
+    # MOPS 查詢是唯讀的，POST 遇到 5xx 可以安全重試
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "POST"]),
+    )
+    # 連線池大小對齊 DETAIL_WORKERS，並行 detail 時全部重用池內連線，不會多開用完即丟的連線
+    session.mount(MOPS_BASE, KeepAliveAdapter(
+        pool_connections=1,
+        pool_maxsize=DETAIL_WORKERS,
+        pool_block=True,
+        max_retries=retry,
+    ))
+    return session
+
+
+SESSION = build_session()
+
 
 def roc_year(dt: datetime) -> int:
     # 民國年 = 西元年 - 1911
@@ -25,6 +84,9 @@ def roc_year(dt: datetime) -> int:
 
 def normalize_text(s: str) -> str:
     # 把 \r\n 等換行、連續空白壓成單一空白
+    # 日期/時間/代號通常本來就乾淨，先檢查一下可省掉三次 replace 的新字串
+    if "\r" not in s and " " not in s:
+        return s
     s = s.replace("\r\n", "").replace("\r", "").replace(" ", "")
     return s
 
@@ -36,30 +98,46 @@ def load_keywords(path: str) -> List[str]:
             k = line.strip()
             if k and not k.startswith("#"):
                 kws.append(k)
+    # 重複的字只留一個（保留檔案順序），否則同一個字會在 matched_keywords 出現兩次
+    kws = list(dict.fromkeys(kws))
     # 長字優先（避免短字先匹配造成訊息太雜）
     kws.sort(key=len, reverse=True)
     return kws
 
 
-def match_keywords(subject: str, keywords: List[str]) -> List[str]:
+def compile_keywords(keywords: List[str]) -> "re.Pattern[str]":
+    # 全部關鍵字合成一個 regex，在 C 層一次掃完主旨（大部分列都不會命中）
+    return re.compile("|".join(re.escape(k) for k in keywords))
+
+
+def match_keywords(subject: str, keywords: List[str], pattern: Optional["re.Pattern[str]"] = None) -> List[str]:
+    # 先用合併 regex 快篩；有命中才逐字確認，保留原本「全部命中的字、長字優先」的結果
+    if pattern is not None and not pattern.search(subject):
+        return []
+    n = len(subject)
     hits = []
     for k in keywords:
+        # 比主旨還長的字不可能命中，不必掃
+        if len(k) > n:
+            continue
         if k in subject:
             hits.append(k)
     return hits
 
 
 def http_post_json(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "Origin": "https://mops.twse.com.tw",
-        "Referer": "https://mops.twse.com.tw/mops/web/t05st02",
-        "User-Agent": "Mozilla/5.0 (GitHubActions; +https://github.com)",
-    }
-    r = requests.post(url, headers=headers, json=payload, timeout=30)
+    r = SESSION.post(url, headers=MOPS_HEADERS, json=payload, timeout=30)
     r.raise_for_status()
-    return r.json()
+    return loads_json(r.content)
+
+
+def list_fingerprint(data: List[Any], list_payload: Dict[str, Any], keywords: List[str]) -> str:
+    # list 的公告列 + 查詢日期 + 關鍵字；三者都沒變，這次跑出來的結果就跟上次一樣
+    # （只取 data，回應裡的查詢時間之類每次都會變的欄位不算）
+    h = hashlib.blake2b(dumps_compact(data).encode("utf-8"), digest_size=16)
+    h.update(json.dumps(list_payload, sort_keys=True).encode("utf-8"))
+    h.update("\n".join(keywords).encode("utf-8"))
+    return h.hexdigest()
 
 
 def load_state(state_path: str) -> Dict[str, Any]:
@@ -68,7 +146,7 @@ def load_state(state_path: str) -> Dict[str, Any]:
     - 不存在 -> 回傳預設
     - 空檔/壞 JSON -> 印出原始內容，回傳預設（避免 workflow 直接掛掉）
     """
-    default = {"seen_keys": []}
+    default = {"seen_keys": [], "last_list_hash": None}
 
     if not os.path.exists(state_path):
         return default
@@ -79,7 +157,7 @@ def load_state(state_path: str) -> Dict[str, Any]:
             if not raw.strip():
                 print(f"[warn] state file exists but empty: {state_path}")
                 return default
-            return json.loads(raw)
+            return loads_json(raw)
     except Exception as e:
         # 印出檔案內容（最多前 5000 字，避免 log 爆）
         try:
@@ -94,19 +172,90 @@ def load_state(state_path: str) -> Dict[str, Any]:
         return default
 
 
-def save_json(path: str, obj: Any) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+_ENSURED_DIRS: Set[str] = set()
+
+
+def _ensure_dir(path: str) -> None:
+    # 同一個目錄只 makedirs 一次（public/ 每次執行會寫好幾個檔）
+    if path and path not in _ENSURED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _ENSURED_DIRS.add(path)
 
 
-def save_csv(path: str, rows: List[Dict[str, Any]], fieldnames: List[str]) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8", newline="") as f:
+def load_seen_keys(keys_path: str, state_path: str) -> Set[str]:
+    """
+    讀取已通知過的 key（一行一個）：
+    - state.keys 存在 -> 直接讀
+    - 不存在 -> 從舊版 state.json 的 seen_keys 搬過來，寫一次完整檔
+    """
+    if os.path.exists(keys_path):
+        with open(keys_path, "r", encoding="utf-8") as f:
+            return {k for k in f.read().splitlines() if k}
+
+    seen_keys = set(load_state(state_path).get("seen_keys", []))
+    if seen_keys:
+        print(f"[info] migrate {len(seen_keys)} seen_keys from {state_path} to {keys_path}")
+        append_seen_keys(keys_path, sorted(seen_keys))
+    return seen_keys
+
+
+def append_seen_keys(keys_path: str, keys: Iterable[str]) -> None:
+    # 只 append 新 key，不必每次重寫整份
+    lines = "".join(f"{k}\n" for k in keys)
+    _ensure_dir(os.path.dirname(keys_path))
+    if not lines:
+        # 沒有新 key 也要讓檔案存在（main 用它判斷輸出是否齊全）
+        if not os.path.exists(keys_path):
+            open(keys_path, "a", encoding="utf-8").close()
+        return
+    # 上次若寫到一半被砍（最後一行沒有換行），先補一個換行，避免新 key 黏在殘缺的那行後面
+    if os.path.exists(keys_path) and os.path.getsize(keys_path) > 0:
+        with open(keys_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                lines = "\n" + lines
+    with open(keys_path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def loads_json(raw: Any) -> Any:
+    # raw 可以是 bytes 或 str；orjson 直接吃 bytes，不用先 decode
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps_compact(obj: Any) -> str:
+    # 單行 JSON 字串（CSV 的 detail_json 用）
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    # 分隔符跟 orjson 一樣（不留空白），兩條路徑輸出同樣的內容
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def save_json(path: str, obj: Any) -> None:
+    # 先寫 .tmp 再 os.replace：中途被砍也不會留下寫一半的檔
+    _ensure_dir(os.path.dirname(path))
+    tmp = path + ".tmp"
+    if orjson is not None:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def save_csv(path: str, rows: Iterable[Dict[str, Any]], fieldnames: List[str]) -> None:
+    # rows 可以是 generator：一列一列寫，不用先組好整個 list
+    # 同 save_json，寫完整才換上去
+    _ensure_dir(os.path.dirname(path))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
         w = csv.DictWriter(f, fieldnames=fieldnames)
         w.writeheader()
-        for row in rows:
-            w.writerow(row)
+        w.writerows(rows)
+    os.replace(tmp, path)
 
 ######20260106新增######
 def load_json_file(path: str, default: Any):
@@ -117,11 +266,24 @@ def load_json_file(path: str, default: Any):
             raw = f.read()
         if not raw.strip():
             return default
-        return json.loads(raw)
+        return loads_json(raw)
     except Exception:
         return default
 
 
+def load_cached_items(path: str) -> Dict[str, Dict[str, Any]]:
+    # 上一次輸出的 items（key -> item），只收有 detail 的
+    obj = load_json_file(path, {})
+    items = obj.get("items") if isinstance(obj, dict) else None
+    if not isinstance(items, list):
+        return {}
+    cached = {}
+    for it in items:
+        if isinstance(it, dict) and it.get("key") and it.get("detail") is not None:
+            cached[it["key"]] = it
+    return cached
+
+
 def update_manifest(manifest_path: str, csv_filename: str) -> None:
     # manifest.json 格式：{"files": ["data_20260106.csv", ...]}
     manifest = load_json_file(manifest_path, {"files": []})
@@ -145,7 +307,7 @@ def telegram_notify(token: str, chat_id: str, text: str) -> None:
     if not token or not chat_id:
         return
     url = f"https://api.telegram.org/bot{token}/sendMessage"
-    requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=20).raise_for_status()
+    SESSION.post(url, json={"chat_id": chat_id, "text": text}, timeout=20).raise_for_status()
 
 
 def line_push(channel_access_token: str, to: str, text: str) -> None:
@@ -155,12 +317,31 @@ def line_push(channel_access_token: str, to: str, text: str) -> None:
     url = "https://api.line.me/v2/bot/message/push"
     headers = {"Authorization": f"Bearer {channel_access_token}", "Content-Type": "application/json"}
     body = {"to": to, "messages": [{"type": "text", "text": text}]}
-    requests.post(url, headers=headers, json=body, timeout=20).raise_for_status()
+    SESSION.post(url, headers=headers, json=body, timeout=20).raise_for_status()
 
 
 def build_item_key(params: Dict[str, Any]) -> str:
     # 用 detail parameters 做唯一鍵，避免同一筆重複通知
-    return f"{params.get('enterDate')}|{params.get('marketKind')}|{params.get('companyId')}|{params.get('serialNumber')}"
+    get = params.get
+    return f"{get('enterDate')}|{get('marketKind')}|{get('companyId')}|{get('serialNumber')}"
+
+
+def build_csv_row(it: Dict[str, Any]) -> Dict[str, Any]:
+    p = it["detail_params"]
+    return {
+        "key": it["key"],
+        "speech_date": it["speech_date"],
+        "speech_time": it["speech_time"],
+        "company_id": it["company_id"],
+        "company_name": it["company_name"],
+        "subject": it["subject"],
+        "matched_keywords": "|".join(it["matched_keywords"]),
+        "enterDate": p.get("enterDate"),
+        "marketKind": p.get("marketKind"),
+        "serialNumber": p.get("serialNumber"),
+        "detail_json": dumps_compact(it["detail"]),
+        "fetched_at_tw": it["fetched_at_tw"],
+    }
 
 
 def main():
@@ -169,54 +350,79 @@ def main():
     ap.add_argument("--out-json", required=True)
     ap.add_argument("--out-csv", required=True)
     ap.add_argument("--state", default="public/state.json")
+    ap.add_argument("--seen-keys", default="public/state.keys")
     args = ap.parse_args()
 
     keywords = load_keywords(args.keywords)
+    keyword_re = compile_keywords(keywords)
     print(keywords)
     now_tw = datetime.now(TAIPEI_TZ)
     y = str(roc_year(now_tw))              # e.g. 115
     m = str(now_tw.month)                  # e.g. "1" (不補零，符合你範例)
     d = f"{now_tw.day:02d}"                # e.g. "04"
+    now_tw_str = now_tw.strftime("%Y-%m-%d %H:%M:%S")  # 整次執行共用，不必每筆再 strftime
 
     # 1) list
     list_payload = {"year": y, "month": m, "day": d}
     list_json = http_post_json(LIST_API, list_payload)
 
     data = list_json.get("result", {}).get("data", []) or []
+    print(f"[info] list rows={len(data)}")
 
+    # 每天一份 CSV：data_YYYYMMDD.csv（西元年月日）
+    today_yyyymmdd = now_tw.strftime("%Y%m%d")
+    daily_csv_name = f"data_{today_yyyymmdd}.csv"
+    daily_csv_path = os.path.join("public", daily_csv_name)
+
+    # list 沒變（排程大部分時候如此）就不用再比對、抓 detail、重寫輸出
+    # 但上次的輸出要都還在才能跳過，少了任何一個就照常重跑補回來
     state = load_state(args.state)
-    seen_keys = set(state.get("seen_keys", []))
+    list_hash = list_fingerprint(data, list_payload, keywords)
+    outputs = [args.out_json, daily_csv_path, args.seen_keys]
+    if state.get("last_list_hash") == list_hash and all(os.path.exists(p) for p in outputs):
+        # 網頁顯示的「執行時間」仍要跟著每次執行更新，不然看不出排程是沒新公告還是已經停了
+        prev_out = load_json_file(args.out_json, None)
+        if isinstance(prev_out, dict) and isinstance(prev_out.get("meta"), dict):
+            prev_out["meta"]["run_at_tw"] = now_tw_str
+            prev_out["meta"]["new_matched_count"] = 0
+            save_json(args.out_json, prev_out)
+            print(f"[info] list unchanged (hash={list_hash}), skip")
+            return
+
+    seen_keys = load_seen_keys(args.seen_keys, args.state)
+    # 上次輸出的 data.json：已處理過的 key 直接沿用當時抓到的 detail，不再重打 DETAIL_API
+    prev_items = load_cached_items(args.out_json)
 
     matched_items: List[Dict[str, Any]] = []
     new_matched_items: List[Dict[str, Any]] = []
 
+    # 2a) 先過濾出命中的列，detail 之後一次並行抓
     for row in data:
         # row: ["114/01/02","17:32:17","3004","豐達科","主旨",{ apiName, parameters }]
         if not isinstance(row, list) or len(row) < 6:
             continue
 
-        speech_date = normalize_text(str(row[0]))
-        speech_time = normalize_text(str(row[1]))
-        company_id = normalize_text(str(row[2]))
-        company_name = normalize_text(str(row[3]))
+        # 先只處理主旨比對關鍵字；大部分列不會命中，其他欄位命中後才整理
         subject_raw = str(row[4])
         subject = normalize_text(subject_raw)
 
-        print(f"[info] data=> speech_date: {speech_date}, speech_time: {speech_time}, company_name: {company_name}, subject: {subject}")
-        
+        hits = match_keywords(subject, keywords, keyword_re)
+        if not hits:
+            continue
+
         detail_meta = row[5] if isinstance(row[5], dict) else {}
         params = (detail_meta.get("parameters") or {}) if isinstance(detail_meta, dict) else {}
         if not isinstance(params, dict):
             continue
 
-        hits = match_keywords(subject, keywords)
-        if not hits:
-            continue
+        speech_date = normalize_text(str(row[0]))
+        speech_time = normalize_text(str(row[1]))
+        company_id = normalize_text(str(row[2]))
+        company_name = normalize_text(str(row[3]))
 
-        key = build_item_key(params)
+        print(f"[info] data=> speech_date: {speech_date}, speech_time: {speech_time}, company_name: {company_name}, subject: {subject}")
 
-        # 2) detail（只對命中者抓 detail）
-        detail = http_post_json(DETAIL_API, params)
+        key = build_item_key(params)
 
         item = {
             "key": key,
@@ -227,22 +433,34 @@ def main():
             "subject": subject,
             "matched_keywords": hits,
             "detail_params": params,
-            "detail": detail,
-            "fetched_at_tw": now_tw.strftime("%Y-%m-%d %H:%M:%S"),
+            "detail": None,
+            "fetched_at_tw": now_tw_str,
         }
         matched_items.append(item)
 
         if key not in seen_keys:
             new_matched_items.append(item)
-
-    # 更新 state：把本次命中也記住（避免下次重複通知）
-    for it in matched_items:
-        seen_keys.add(it["key"])
+        elif key in prev_items:
+            item["detail"] = prev_items[key]["detail"]
+            item["fetched_at_tw"] = prev_items[key].get("fetched_at_tw", item["fetched_at_tw"])
+
+    # 上次的 items 用完就放掉：沿用的 detail 已經掛在新 item 上，其餘（例如昨天的）不必陪著
+    # 一起留到輸出 JSON/CSV，記憶體裡同時只有一份 detail
+    del prev_items
+
+    # 2b) detail（只對命中且還沒有 detail 者抓；彼此獨立，共用 SESSION 連線池並行抓）
+    to_fetch = [it for it in matched_items if it["detail"] is None]
+    print(f"[info] detail: fetch={len(to_fetch)} reuse={len(matched_items) - len(to_fetch)}")
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=DETAIL_WORKERS) as ex:
+            details = ex.map(lambda it: http_post_json(DETAIL_API, it["detail_params"]), to_fetch)
+            for it, detail in zip(to_fetch, details):
+                it["detail"] = detail
 
     # 輸出 JSON 給網頁用
     save_json(args.out_json, {
         "meta": {
-            "run_at_tw": now_tw.strftime("%Y-%m-%d %H:%M:%S"),
+            "run_at_tw": now_tw_str,
             "query": {"year": y, "month": m, "day": d},
             "keywords": keywords,
             "matched_count": len(matched_items),
@@ -251,33 +469,12 @@ def main():
         "items": matched_items,
     })
 
-    # 輸出 CSV（扁平化一些常用欄位；detail 整包塞 json 字串）
-    csv_rows = []
-    for it in matched_items:
-        csv_rows.append({
-            "key": it["key"],
-            "speech_date": it["speech_date"],
-            "speech_time": it["speech_time"],
-            "company_id": it["company_id"],
-            "company_name": it["company_name"],
-            "subject": it["subject"],
-            "matched_keywords": "|".join(it["matched_keywords"]),
-            "enterDate": it["detail_params"].get("enterDate"),
-            "marketKind": it["detail_params"].get("marketKind"),
-            "serialNumber": it["detail_params"].get("serialNumber"),
-            "detail_json": json.dumps(it["detail"], ensure_ascii=False),
-            "fetched_at_tw": it["fetched_at_tw"],
-        })
-        
 ######20260106變更######
-    # 每天一份 CSV：data_YYYYMMDD.csv（西元年月日）
-    today_yyyymmdd = now_tw.strftime("%Y%m%d")
-    daily_csv_name = f"data_{today_yyyymmdd}.csv"
-    daily_csv_path = os.path.join("public", daily_csv_name)
-    
+    # 每天一份 CSV（daily_csv_path 在上面 list 比對前就決定好了）
     save_csv(
         daily_csv_path,
-        csv_rows,
+        # 輸出 CSV（扁平化一些常用欄位；detail 整包塞 json 字串），邊產生邊寫
+        (build_csv_row(it) for it in matched_items),
         fieldnames=[
             "key","speech_date","speech_time","company_id","company_name","subject",
             "matched_keywords","enterDate","marketKind","serialNumber","detail_json","fetched_at_tw"
@@ -288,8 +485,11 @@ def main():
     update_manifest("public/manifest.json", daily_csv_name)
 ######20260106變更######
 
-    # state 存檔
-    save_json(args.state, {"seen_keys": sorted(seen_keys)})
+    # 更新 state：把本次新命中 append 進 state.keys（避免下次重複通知）
+    append_seen_keys(args.seen_keys, dict.fromkeys(it["key"] for it in new_matched_items))
+    # list 指紋併進原本的 state.json；舊版 seen_keys 保留著，state.keys 不見時還能從這裡搬回來
+    state["last_list_hash"] = list_hash
+    save_json(args.state, state)
 
     # 3) 通知（只通知「新命中」）
     if new_matched_items: